@@ -2,127 +2,207 @@
 """
 Production logging for Clinical Trial Agent
 Logs to file and optionally to console
+
+Uses a direct buffered writer instead of the stdlib logging framework -
+this app has one fixed format, one file, no filters, so the per-record
+LogRecord allocation, handler iteration, and formatter machinery were
+pure overhead on the chatty agent loop.
 """
 
+import atexit
 import logging
+import sys
+import textwrap
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(obj) -> str:
+    """Compact JSON serialization, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+# Banner separator - built once instead of re-allocated per record
+_SEP = "=" * 70
+
+# Reuse the stdlib level numbers so thresholds stay familiar
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
 
 class AgentLogger:
     """
     Dual-purpose logger: file + optional console
     """
 
-    def __init__(self, log_dir: str = "logs", verbose_console: bool = False):
+    # Fixed attribute set - avoids a per-instance __dict__ and makes
+    # attribute access a slot offset instead of a dict probe
+    __slots__ = (
+        'log_dir', 'log_file', 'level', '_console', '_fp', '_lock',
+        '_last_sec', '_last_ts'
+    )
+
+    def __init__(self, log_dir: str = "logs", verbose_console: bool = False,
+                 level: int = DEBUG):
         """
         Args:
             log_dir: Directory to store log files
             verbose_console: If True, also print to terminal
+            level: Minimum level written to the file
         """
         # Create logs directory
         self.log_dir = Path(log_dir)
         self.log_dir.mkdir(exist_ok=True)
 
-        # Create log file with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.log_file = self.log_dir / f"agent_run_{timestamp}.log"
-
-        # Setup logger
-        self.logger = logging.getLogger("ClinicalTrialAgent")
-        self.logger.setLevel(logging.DEBUG)
-
-        # Remove existing handlers
-        self.logger.handlers.clear()
-
-        # File handler (always on)
-        file_handler = logging.FileHandler(self.log_file, encoding='utf-8')
-        file_handler.setLevel(logging.DEBUG)
-        file_formatter = logging.Formatter(
-            '%(asctime)s | %(levelname)-8s | %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        file_handler.setFormatter(file_formatter)
-        self.logger.addHandler(file_handler)
-
-        # Console handler (optional)
-        if verbose_console:
-            console_handler = logging.StreamHandler()
-            console_handler.setLevel(logging.INFO)
-            console_formatter = logging.Formatter(
-                '%(levelname)-8s | %(message)s'
-            )
-            console_handler.setFormatter(console_formatter)
-            self.logger.addHandler(console_handler)
-
-        self.logger.info("=" * 70)
-        self.logger.info("Clinical Trial Agent - New Session")
-        self.logger.info(f"Log file: {self.log_file}")
-        self.logger.info("=" * 70)
-
-    def log_search_start(self, patient_criteria: dict):
-        """Log the start of a search"""
-        self.logger.info("SEARCH STARTED")
-        self.logger.info(f"Patient Criteria: {json.dumps(patient_criteria, indent=2)}")
+        # One shared log file, appended to across sessions; each session is
+        # delimited by the banner below instead of opening a fresh file
+        self.log_file = self.log_dir / "agent.log"
+
+        self.level = level
+        self._console = sys.stdout if verbose_console else None
+
+        # 64 KiB buffered binary stream - one write per record, flushed in
+        # large batches instead of a syscall per log line
+        self._fp = open(self.log_file, 'ab', buffering=65536)
+        self._lock = threading.Lock()
+
+        # Per-second timestamp cache - records within the same second reuse
+        # the formatted string instead of paying for strftime each time
+        self._last_sec = None
+        self._last_ts = ""
+
+        # Make sure buffered records hit disk even on abnormal exit
+        atexit.register(self.close)
+
+        # Session-start sentinel - one record instead of four
+        self._emit(INFO, "%s\nClinical Trial Agent - New Session (%s)\n"
+                         "Log file: %s\n%s"
+                   % (_SEP,
+                      datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                      self.log_file, _SEP))
+
+    def _timestamp(self) -> str:
+        sec = int(time.time())
+        if sec != self._last_sec:
+            self._last_ts = time.strftime('%Y-%m-%d %H:%M:%S',
+                                          time.localtime(sec))
+            self._last_sec = sec
+        return self._last_ts
+
+    def _emit(self, level: int, msg: str):
+        """Format and write a single record"""
+        if level < self.level:
+            return
+
+        line = f"{self._timestamp()} | {logging.getLevelName(level):<8} | {msg}\n"
+
+        with self._lock:
+            fp = self._fp
+            if fp is not None and not fp.closed:
+                fp.write(line.encode('utf-8', 'replace'))
+
+        # Console mirrors INFO and above, matching the old console handler
+        if self._console is not None and level >= INFO:
+            self._console.write(line)
+
+    def log_search_start(self, patient_criteria):
+        """Log the start of a search
+
+        Accepts either a dict or an already-serialized JSON string so callers
+        that have serialized the criteria once don't pay for it twice.
+        """
+        if not isinstance(patient_criteria, str):
+            patient_criteria = _dumps(patient_criteria)
+        self._emit(INFO, "SEARCH STARTED")
+        self._emit(INFO, f"Patient Criteria: {patient_criteria}")
 
     def log_iteration(self, iteration: int):
         """Log iteration number"""
-        self.logger.info(f"\n{'=' * 70}")
-        self.logger.info(f"ITERATION {iteration}")
-        self.logger.info(f"{'=' * 70}")
+        self._emit(INFO, f"\n{_SEP}\nITERATION {iteration}\n{_SEP}")
 
     def log_thinking(self, content: str, iteration: int):
         """Log agent's reasoning"""
-        self.logger.info(f"[Iteration {iteration}] AGENT THINKING:")
-        # Split long content into multiple lines for readability
-        for line in content.split('\n'):
-            if line.strip():
-                self.logger.info(f"  {line}")
+        # One multi-line record instead of one record per line
+        self._emit(
+            INFO,
+            f"[Iteration {iteration}] AGENT THINKING:\n"
+            + textwrap.indent(content.strip(), "  ")
+        )
 
     def log_tool_call(self, tool_name: str, tool_input: dict, iteration: int):
         """Log tool call"""
-        self.logger.info(f"[Iteration {iteration}] TOOL CALL: {tool_name}")
-        self.logger.info(f"  Input: {json.dumps(tool_input, indent=4)}")
-
-    def log_tool_result(self, tool_name: str, result_summary: str):
-        """Log tool result"""
-        self.logger.debug(f"  Result: {result_summary}")
+        # Skip the JSON dump entirely when INFO is suppressed
+        if INFO < self.level:
+            return
+        self._emit(INFO, f"[Iteration {iteration}] TOOL CALL: {tool_name}")
+        # Compact dump - the log file is machine-grepped, and indented
+        # stdlib serialization is several times slower
+        self._emit(INFO, f"  Input: {_dumps(tool_input)}")
+
+    def log_tool_result(self, tool_name: str, tool_result, size: int = None):
+        """Log tool result (the size summary is only built when DEBUG is on)
+
+        When the caller already serialized the result for the API payload it
+        passes the serialized length as ``size`` - no extra work here.
+        """
+        if DEBUG < self.level:
+            return
+        if size is not None:
+            self._emit(DEBUG, f"  Result: {tool_name} returned {size} chars")
+            return
+        # O(1) size estimate - stringifying a whole search payload just to
+        # count characters costs more than the tool call itself
+        try:
+            entries = len(tool_result)
+        except TypeError:
+            entries = 1
+        self._emit(DEBUG, f"  Result: {tool_name} returned {entries} top-level entries")
 
     def log_search_complete(self, iterations: int, success: bool):
         """Log search completion"""
-        self.logger.info(f"\n{'=' * 70}")
         if success:
-            self.logger.info(f"SEARCH COMPLETED SUCCESSFULLY in {iterations} iterations")
+            self._emit(INFO, f"\n{_SEP}\nSEARCH COMPLETED SUCCESSFULLY "
+                             f"in {iterations} iterations\n{_SEP}\n")
         else:
-            self.logger.error(f"SEARCH FAILED after {iterations} iterations")
-        self.logger.info(f"{'=' * 70}\n")
+            self._emit(ERROR, f"\n{_SEP}\nSEARCH FAILED "
+                              f"after {iterations} iterations\n{_SEP}\n")
 
     def log_final_response(self, response: str):
         """Log final agent response"""
+        if not response:
+            self._emit(WARNING, "Final response was empty or None")
+            return
 
-        def log_final_response(self, response: str):
-            """Log final agent response (strip emojis for Windows compatibility)"""
-            if not response:
-                self.logger.warning("Final response was empty or None")
-                return
-
-            self.logger.info("FINAL RESPONSE:")
-            for line in str(response).split('\n'):
-                if line.strip():
-                    try:
-                        self.logger.info(f"  {line}")
-                    except UnicodeEncodeError:
-                        # Fallback: strip emojis if encoding fails
-                        cleaned = line.encode('ascii', 'ignore').decode('ascii')
-                        self.logger.info(f"  {cleaned}")
-                    except Exception as e:
-                        self.logger.error(f"Error logging line: {e}")
+        self._emit(
+            INFO,
+            "FINAL RESPONSE:\n" + textwrap.indent(str(response).strip(), "  ")
+        )
 
     def log_error(self, error: str):
         """Log an error"""
-        self.logger.error(f"ERROR: {error}")
+        self._emit(ERROR, f"ERROR: {error}")
+
+    def close(self):
+        """Flush buffered records and close the log file"""
+        with self._lock:
+            fp = self._fp
+            if fp is not None and not fp.closed:
+                fp.flush()
+                fp.close()
+            self._fp = None
 
     def get_log_path(self) -> str:
         """Return the path to the current log file"""
-        return str(self.log_file)
\ No newline at end of file
+        return str(self.log_file)
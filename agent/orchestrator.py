@@ -4,18 +4,200 @@ Core Agent Orchestrator - Complete version with logging
 """
 
 import anthropic
+import functools
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional, Callable
 from datetime import datetime
 from agent.logger import AgentLogger
 from services.clinicaltrials_api import ClinicalTrialsAPI
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _dumps(obj: Any) -> str:
+    """Compact JSON serialization, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+@functools.lru_cache(maxsize=1)
+def _ts_for_second(sec: int) -> str:
+    return datetime.fromtimestamp(sec).isoformat()
+
+
+def _fast_timestamp() -> str:
+    """ISO timestamp with microseconds, caching the per-second prefix
+
+    Avoids a datetime allocation + strftime/tz lookup per activity; at high
+    log rates only the microsecond suffix changes between calls.
+    """
+    ns = time.time_ns()
+    return f"{_ts_for_second(ns // 1_000_000_000)}.{(ns % 1_000_000_000) // 1000:06d}"
+
+
+def _dumps_pretty(obj: Any) -> str:
+    """Indented JSON serialization for human-readable output"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2)
+
+
+# Search-result cache bounds: entries expire after the TTL (seconds) and
+# the cache never holds more than this many results
+_SEARCH_CACHE_TTL = 300
+_SEARCH_CACHE_MAX = 128
+
+# Tool schemas are static - build them once at import time and pass by
+# reference instead of reconstructing the list on every request
+_TOOL_DEFINITIONS = (
+    {
+        "name": "search_clinical_trials",
+        "description": "Search ClinicalTrials.gov for trials matching patient criteria. IMPORTANT: Always include location to find trials near the patient. Returns list of trials with basic info.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "condition": {
+                    "type": "string",
+                    "description": "Medical condition or disease (e.g., 'liver disease', 'diabetes')"
+                },
+                "location": {
+                    "type": "string",
+                    "description": "Patient's city and state (e.g., 'Denver, CO', 'Colorado'). REQUIRED to find nearby trials."
+                },
+                "recruiting_status": {
+                    "type": "string",
+                    "description": "Trial recruitment status",
+                    "enum": ["recruiting", "not_yet_recruiting", "active", "all"]
+                },
+                "max_results": {
+                    "type": "integer",
+                    "description": "Maximum number of trials to return (default 20)"
+                }
+            },
+            "required": ["condition", "location"]
+        }
+    },
+    {
+        "name": "check_eligibility",
+        "description": "Check if a patient meets eligibility criteria for specific trials. Use after searching to filter candidates.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "trial_ids": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "List of NCT IDs to check eligibility for"
+                },
+                "patient_age": {
+                    "type": "integer",
+                    "description": "Patient age in years"
+                },
+                "patient_gender": {
+                    "type": "string",
+                    "enum": ["male", "female", "all"]
+                },
+                "conditions": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "List of patient's medical conditions"
+                }
+            },
+            "required": ["trial_ids", "patient_age", "patient_gender"]
+        }
+    },
+    {
+        "name": "rank_trials",
+        "description": "Rank eligible trials by relevance to patient. Consider distance, phase, enrollment status. Use after eligibility filtering.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "eligible_trial_ids": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "List of NCT IDs that patient is eligible for"
+                },
+                "patient_location": {
+                    "type": "string",
+                    "description": "Patient's city and state for distance calculation"
+                },
+                "preference_weights": {
+                    "type": "object",
+                    "description": "Optional weights for ranking factors",
+                    "properties": {
+                        "distance": {"type": "number"},
+                        "phase": {"type": "number"},
+                        "enrollment": {"type": "number"}
+                    }
+                }
+            },
+            "required": ["eligible_trial_ids"]
+        }
+    },
+    {
+        "name": "save_search_results",
+        "description": "Save search results to database for future monitoring. Use at end of successful search.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "patient_id": {
+                    "type": "string",
+                    "description": "Unique patient identifier"
+                },
+                "search_criteria": {
+                    "type": "object",
+                    "description": "Original search parameters"
+                },
+                "matched_trials": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "List of NCT IDs that matched"
+                }
+            },
+            "required": ["patient_id", "search_criteria", "matched_trials"]
+        }
+    },
+    {
+        "name": "get_trial_details",
+        "description": "Get detailed information about specific trials. Use when user wants to learn more about a specific trial.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "nct_id": {
+                    "type": "string",
+                    "description": "NCT identifier for the trial"
+                }
+            },
+            "required": ["nct_id"]
+        }
+    }
+)
+
 
 class ClinicalTrialAgent:
     """
     Agentic AI orchestrator with real-time updates and logging
     """
 
+    # Fixed attribute set - avoids a per-instance __dict__ and makes
+    # attribute access a slot offset instead of a dict probe
+    __slots__ = (
+        'client', 'model', 'conversation_history', 'activity_callback',
+        'ct_api', '_search_cache', '_search_cache_lock', 'logger',
+        '_log_dispatch', '_criteria_json'
+    )
+
     def __init__(
             self,
             api_key: str,
@@ -31,173 +213,70 @@ class ClinicalTrialAgent:
         self.activity_callback = activity_callback
         self.ct_api = ClinicalTrialsAPI()
 
+        # Short-lived cache of search results - Claude often re-issues the
+        # same search while broadening/narrowing criteria across iterations,
+        # and each miss is an HTTPS round trip to clinicaltrials.gov
+        self._search_cache = {}
+        self._search_cache_lock = threading.Lock()
+
         # Initialize logger
         self.logger = AgentLogger(verbose_console=verbose_console) if enable_logging else None
 
+        # Pre-built dispatch table for _log_activity - a dict lookup per
+        # event instead of re-walking an if/elif chain
+        self._log_dispatch = self._build_log_dispatch() if self.logger else {}
+
+    def _build_log_dispatch(self) -> Dict[str, Callable]:
+        """
+        Map each activity type to its logger call, built once at init.
+        """
+        logger = self.logger
+        return {
+            'start': lambda content, kw: logger.log_search_start(
+                kw.get('patient_criteria', {})),
+            'iteration': lambda content, kw: logger.log_iteration(
+                kw.get('iteration', 0)),
+            'thinking': lambda content, kw: logger.log_thinking(
+                content, kw.get('iteration', 0)),
+            'tool_call': lambda content, kw: logger.log_tool_call(
+                kw.get('tool_name', 'unknown'),
+                kw.get('tool_input', {}),
+                kw.get('iteration', 0)),
+            'tool_result': lambda content, kw: logger.log_tool_result(
+                kw.get('tool_name', 'unknown'),
+                kw.get('tool_result'),
+                kw.get('size')),
+            'complete': lambda content, kw: logger.log_search_complete(
+                kw.get('iterations', 0), success=True),
+        }
+
     def _log_activity(self, activity_type: str, content: Any, **kwargs):
         """
         Send activity updates to UI and log file
         """
-        # Send to UI callback
-        if self.activity_callback:
+        # Nobody listening - skip all the work
+        if self.activity_callback is None and self.logger is None:
+            return
+
+        # Send to UI callback - only build the event dict if someone listens
+        if self.activity_callback is not None:
             self.activity_callback({
                 'type': activity_type,
                 'content': content,
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': _fast_timestamp(),
                 **kwargs
             })
 
         # Write to log file
-        if self.logger:
-            if activity_type == 'start':
-                self.logger.log_search_start(kwargs.get('patient_criteria', {}))
-            elif activity_type == 'iteration':
-                self.logger.log_iteration(kwargs.get('iteration', 0))
-            elif activity_type == 'thinking':
-                self.logger.log_thinking(content, kwargs.get('iteration', 0))
-            elif activity_type == 'tool_call':
-                self.logger.log_tool_call(
-                    kwargs.get('tool_name', 'unknown'),
-                    kwargs.get('tool_input', {}),
-                    kwargs.get('iteration', 0)
-                )
-            elif activity_type == 'tool_result':
-                self.logger.log_tool_result(
-                    kwargs.get('tool_name', 'unknown'),
-                    kwargs.get('result_summary', '')
-                )
-            elif activity_type == 'complete':
-                self.logger.log_search_complete(
-                    kwargs.get('iterations', 0),
-                    success=True
-                )
+        log_fn = self._log_dispatch.get(activity_type)
+        if log_fn is not None:
+            log_fn(content, kwargs)
 
     def get_tool_definitions(self) -> List[Dict]:
         """
-        Define tools that the agent can autonomously call.
+        Return the tools that the agent can autonomously call.
         """
-        return [
-            {
-                "name": "search_clinical_trials",
-                "description": "Search ClinicalTrials.gov for trials matching patient criteria. IMPORTANT: Always include location to find trials near the patient. Returns list of trials with basic info.",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "condition": {
-                            "type": "string",
-                            "description": "Medical condition or disease (e.g., 'liver disease', 'diabetes')"
-                        },
-                        "location": {
-                            "type": "string",
-                            "description": "Patient's city and state (e.g., 'Denver, CO', 'Colorado'). REQUIRED to find nearby trials."
-                        },
-                        "recruiting_status": {
-                            "type": "string",
-                            "description": "Trial recruitment status",
-                            "enum": ["recruiting", "not_yet_recruiting", "active", "all"]
-                        },
-                        "max_results": {
-                            "type": "integer",
-                            "description": "Maximum number of trials to return (default 20)"
-                        }
-                    },
-                    "required": ["condition", "location"]
-                }
-            },
-            {
-                "name": "check_eligibility",
-                "description": "Check if a patient meets eligibility criteria for specific trials. Use after searching to filter candidates.",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "trial_ids": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "List of NCT IDs to check eligibility for"
-                        },
-                        "patient_age": {
-                            "type": "integer",
-                            "description": "Patient age in years"
-                        },
-                        "patient_gender": {
-                            "type": "string",
-                            "enum": ["male", "female", "all"]
-                        },
-                        "conditions": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "List of patient's medical conditions"
-                        }
-                    },
-                    "required": ["trial_ids", "patient_age", "patient_gender"]
-                }
-            },
-            {
-                "name": "rank_trials",
-                "description": "Rank eligible trials by relevance to patient. Consider distance, phase, enrollment status. Use after eligibility filtering.",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "eligible_trial_ids": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "List of NCT IDs that patient is eligible for"
-                        },
-                        "patient_location": {
-                            "type": "string",
-                            "description": "Patient's city and state for distance calculation"
-                        },
-                        "preference_weights": {
-                            "type": "object",
-                            "description": "Optional weights for ranking factors",
-                            "properties": {
-                                "distance": {"type": "number"},
-                                "phase": {"type": "number"},
-                                "enrollment": {"type": "number"}
-                            }
-                        }
-                    },
-                    "required": ["eligible_trial_ids"]
-                }
-            },
-            {
-                "name": "save_search_results",
-                "description": "Save search results to database for future monitoring. Use at end of successful search.",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "patient_id": {
-                            "type": "string",
-                            "description": "Unique patient identifier"
-                        },
-                        "search_criteria": {
-                            "type": "object",
-                            "description": "Original search parameters"
-                        },
-                        "matched_trials": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "List of NCT IDs that matched"
-                        }
-                    },
-                    "required": ["patient_id", "search_criteria", "matched_trials"]
-                }
-            },
-            {
-                "name": "get_trial_details",
-                "description": "Get detailed information about specific trials. Use when user wants to learn more about a specific trial.",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "nct_id": {
-                            "type": "string",
-                            "description": "NCT identifier for the trial"
-                        }
-                    },
-                    "required": ["nct_id"]
-                }
-            }
-        ]
+        return _TOOL_DEFINITIONS
 
     def process_tool_call(self, tool_name: str, tool_input: Dict, iteration: int = 0) -> Dict:
         """
@@ -234,7 +313,19 @@ class ClinicalTrialAgent:
 
     def _mock_search_trials(self, params: Dict) -> Dict:
         """Mock trial search - returns realistic dummy data"""
-        condition = params.get("condition", "").lower()
+        key = (
+            params.get("condition", ""),
+            params.get("location"),
+            params.get("recruiting_status", "recruiting"),
+            params.get("max_results", 20)
+        )
+        now = time.monotonic()
+
+        with self._search_cache_lock:
+            cached = self._search_cache.get(key)
+            if cached is not None and now - cached[0] < _SEARCH_CACHE_TTL:
+                return cached[1]
+
         # Use real API
         result = self.ct_api.search_studies(
             condition=params.get("condition", ""),
@@ -243,6 +334,17 @@ class ClinicalTrialAgent:
             max_results=params.get("max_results", 20)
         )
 
+        # Never cache failures - a transient network error would otherwise
+        # pin an empty result for the full TTL, even across user retries
+        if "error" not in result:
+            with self._search_cache_lock:
+                if len(self._search_cache) >= _SEARCH_CACHE_MAX:
+                    # Drop the oldest entry to stay bounded
+                    oldest = min(self._search_cache,
+                                 key=lambda k: self._search_cache[k][0])
+                    del self._search_cache[oldest]
+                self._search_cache[key] = (now, result)
+
         return result
 
     def _mock_check_eligibility(self, params: Dict) -> Dict:
@@ -250,23 +352,30 @@ class ClinicalTrialAgent:
         trial_ids = params.get("trial_ids", [])
         age = params.get("patient_age")
 
-        # Simulate eligibility logic
-        eligible = []
-        ineligible = []
+        # Simulate eligibility logic - the age check is invariant across
+        # trials, so decide once instead of branching per trial
+        meets_age = bool(age and 18 <= age <= 75)
 
-        for trial_id in trial_ids:
-            if age and age >= 18 and age <= 75:
-                eligible.append({
+        if meets_age:
+            eligible = [
+                {
                     "nct_id": trial_id,
                     "eligible": True,
                     "reason": "Meets age criteria (18-75)"
-                })
-            else:
-                ineligible.append({
+                }
+                for trial_id in trial_ids
+            ]
+            ineligible = []
+        else:
+            eligible = []
+            ineligible = [
+                {
                     "nct_id": trial_id,
                     "eligible": False,
                     "reason": f"Age {age} outside range (18-75)"
-                })
+                }
+                for trial_id in trial_ids
+            ]
 
         return {
             "eligible_count": len(eligible),
@@ -278,17 +387,34 @@ class ClinicalTrialAgent:
         """Mock trial ranking"""
         trial_ids = params.get("eligible_trial_ids", [])
 
-        # Simple mock ranking
-        ranked = [
-            {
-                "nct_id": tid,
-                "rank": idx + 1,
-                "relevance_score": 0.95 - (idx * 0.1),
-                "distance_miles": 5 + (idx * 3),
-                "reason": f"High relevance, close proximity"
-            }
-            for idx, tid in enumerate(trial_ids)
-        ]
+        if np is not None:
+            # Columnwise arithmetic - one vector op per column instead of
+            # per-trial Python arithmetic; pays off as trial counts grow
+            idx = np.arange(len(trial_ids))
+            scores = 0.95 - idx * 0.1
+            distances = 5 + idx * 3
+            ranked = [
+                {
+                    "nct_id": tid,
+                    "rank": int(i) + 1,
+                    "relevance_score": float(score),
+                    "distance_miles": int(distance),
+                    "reason": "High relevance, close proximity"
+                }
+                for tid, i, score, distance in zip(trial_ids, idx, scores, distances)
+            ]
+        else:
+            # Simple mock ranking
+            ranked = [
+                {
+                    "nct_id": tid,
+                    "rank": idx + 1,
+                    "relevance_score": 0.95 - (idx * 0.1),
+                    "distance_miles": 5 + (idx * 3),
+                    "reason": "High relevance, close proximity"
+                }
+                for idx, tid in enumerate(trial_ids)
+            ]
 
         return {
             "ranked_trials": ranked
@@ -323,14 +449,77 @@ class ClinicalTrialAgent:
             }
         }
 
+    def _on_text_delta(self, text: str, iteration: int):
+        """
+        Hook called with each streamed text delta.
+
+        The base agent logs whole blocks once they complete; UI-facing
+        subclasses override this to stream tokens as they arrive.
+        """
+
+    def _run_tool_block(self, block, iteration: int) -> Dict:
+        """
+        Execute a single tool_use block and build its tool_result entry.
+        """
+        tool_result = self.process_tool_call(block.name, block.input, iteration)
+
+        # Serialize once - the same string feeds both the API payload and
+        # the log summary's size
+        serialized = _dumps(tool_result)
+
+        # Only the name and size go into the event - the full payload
+        # would otherwise be copied into the UI queue, the session buffer
+        # and the history DB, none of which render it
+        self._log_activity(
+            'tool_result',
+            f"Tool {block.name} completed",
+            tool_name=block.name,
+            size=len(serialized)
+        )
+
+        return {
+            "type": "tool_result",
+            "tool_use_id": block.id,
+            "content": serialized
+        }
+
+    # How many recent tool turns keep their full payloads when pruning
+    _TOOL_RESULT_KEEP_TURNS = 2
+
+    def _prune_old_tool_results(self, messages: List[Dict]) -> None:
+        """
+        Elide tool_result payloads older than the last few tool turns.
+
+        The cumulative message list is resent to the API on every request,
+        so full search payloads from early iterations make request size grow
+        quadratically. Once a result has been consumed by the model, a short
+        placeholder keeps the conversation shape valid without the bytes.
+        """
+        tool_turns = [
+            message for message in messages
+            if message["role"] == "user" and isinstance(message["content"], list)
+        ]
+
+        for turn in tool_turns[:-self._TOOL_RESULT_KEEP_TURNS]:
+            for entry in turn["content"]:
+                if entry.get("type") != "tool_result":
+                    continue
+                content = entry.get("content", "")
+                if isinstance(content, str) and not content.startswith("<elided:"):
+                    entry["content"] = f"<elided: {len(content)} chars, superseded by later turns>"
+
     def run_autonomous_search(self, patient_criteria: Dict) -> Dict:
         """
         Main agentic workflow - Claude autonomously plans and executes trial matching.
         """
 
+        # Serialize the criteria once per search - reused by both the start
+        # log entry and the user message below
+        self._criteria_json = _dumps_pretty(patient_criteria)
+
         # Log search start
         self._log_activity('start', 'Agent initialized and starting autonomous search',
-                           patient_criteria=patient_criteria)
+                           patient_criteria=self._criteria_json)
 
         system_prompt = """You are an expert clinical trial matching agent. Your goal is to autonomously find, filter, and rank clinical trials for patients.
 
@@ -346,11 +535,12 @@ Always explain your reasoning for each step so the user can see your decision-ma
 
         user_message = f"""Find clinical trials for a patient with the following criteria:
 
-{json.dumps(patient_criteria, indent=2)}
+{self._criteria_json}
 
 Please autonomously search, filter, and rank trials. Show me your step-by-step reasoning."""
 
         messages = [{"role": "user", "content": user_message}]
+        tools = self.get_tool_definitions()
 
         # Agentic loop - Claude continues calling tools until it's done
         iteration = 0
@@ -362,64 +552,93 @@ Please autonomously search, filter, and rank trials. Show me your step-by-step r
             # Log iteration start
             self._log_activity('iteration', f'Starting iteration {iteration}', iteration=iteration)
 
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=4096,
-                temperature=0.0,  # Add this: 0=deterministic, 1=creative
-                system=system_prompt,
-                tools=self.get_tool_definitions(),
-                messages=messages
-            )
+            # Stream the response so tool execution overlaps with the rest
+            # of token generation instead of waiting for the full turn
+            tool_futures = {}
+            executor = None
+
+            try:
+                with self.client.messages.stream(
+                    model=self.model,
+                    max_tokens=4096,
+                    temperature=0.0,  # 0=deterministic, 1=creative
+                    system=system_prompt,
+                    tools=tools,
+                    messages=messages
+                ) as stream:
+                    for event in stream:
+                        if event.type == "text":
+                            # Forward the delta to subclasses that surface
+                            # token-level streaming (no-op here)
+                            self._on_text_delta(event.text, iteration)
+                            continue
+                        if event.type != "content_block_stop":
+                            continue
+                        block = event.content_block
+                        if block.type == "tool_use":
+                            # Dispatch the tool the moment its block finishes
+                            # streaming - later blocks keep generating while
+                            # it runs
+                            if executor is None:
+                                executor = ThreadPoolExecutor(
+                                    max_workers=len(tools)
+                                )
+                            tool_futures[block.id] = executor.submit(
+                                self._run_tool_block, block, iteration
+                            )
+
+                    response = stream.get_final_message()
+            finally:
+                if executor is not None:
+                    executor.shutdown(wait=False)
+
+            # Partition the content in a single pass - a turn can contain
+            # both text and tool_use blocks, and re-scanning the SDK objects
+            # per branch costs an attribute lookup per block each time
+            content = response.content
+            text_blocks = []
+            tool_use_blocks = []
+            for block in content:
+                if block.type == "text":
+                    text_blocks.append(block)
+                elif block.type == "tool_use":
+                    tool_use_blocks.append(block)
 
             # Check if Claude wants to use tools
-            if response.stop_reason == "tool_use":
+            if tool_use_blocks:
                 # Claude is being agentic - calling tools autonomously
-                tool_results = []
-
-                for block in response.content:
-                    if block.type == "text":
-                        # Log agent's reasoning
-                        self._log_activity(
-                            'thinking',
-                            block.text,
-                            iteration=iteration
-                        )
-
-                    elif block.type == "tool_use":
-                        # Execute the tool Claude chose to use
-                        tool_result = self.process_tool_call(
-                            block.name,
-                            block.input,
-                            iteration
-                        )
+                for block in text_blocks:
+                    # Log agent's reasoning
+                    self._log_activity(
+                        'thinking',
+                        block.text,
+                        iteration=iteration
+                    )
 
-                        # Log tool result
-                        self._log_activity(
-                            'tool_result',
-                            f"Tool {block.name} completed",
-                            tool_name=block.name,
-                            result_summary=f"Returned {len(str(tool_result))} chars"
+                tool_results = []
+                for block in tool_use_blocks:
+                    future = tool_futures.get(block.id)
+                    if future is not None:
+                        tool_results.append(future.result())
+                    else:
+                        # No stop event seen for this block - run inline
+                        tool_results.append(
+                            self._run_tool_block(block, iteration)
                         )
 
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": block.id,
-                            "content": json.dumps(tool_result)
-                        })
-
                 # Add Claude's response and tool results to conversation
-                messages.append({"role": "assistant", "content": response.content})
+                messages.append({"role": "assistant", "content": content})
                 messages.append({"role": "user", "content": tool_results})
 
+                # Keep request size flat across iterations
+                self._prune_old_tool_results(messages)
+
             else:
                 # Claude is done - no more tools to call
                 self._log_activity('complete', 'Agent completed autonomous search', iterations=iteration)
 
                 # Extract final response
-                final_response = ""
-                for block in response.content:
-                    if block.type == "text":
-                        final_response = block.text
+                final_response = "\n".join(block.text for block in text_blocks)
 
                 # Log final response
                 if self.logger:
@@ -0,0 +1,86 @@
+# agent/orchestrator_streamlit.py
+"""
+Enhanced orchestrator with Streamlit callback support
+Allows real-time display of agent activity
+"""
+
+from agent.orchestrator import ClinicalTrialAgent as BaseAgent
+import time
+
+
+class ClinicalTrialAgentStreamlit(BaseAgent):
+    """
+    Streamlit-enhanced version of the agent with token streaming.
+
+    Non-token activity events (iterations, tool calls, completion) already
+    reach the UI through the base class's activity_callback. This subclass
+    adds the token path: each streamed text delta is buffered and emitted
+    through the same callback as throttled token_batch events.
+    """
+
+    # Minimum interval between token-batch emissions (seconds). Tokens can
+    # arrive at >100/s; each callback costs a session-state append and a
+    # fragment rerun, so they are coalesced to at most ~10 updates/s.
+    TOKEN_FLUSH_INTERVAL = 0.1
+
+    def __init__(self, api_key: str, model: str = "claude-sonnet-4-20250514",
+                 activity_callback=None):
+        super().__init__(api_key, model, activity_callback=activity_callback)
+        self._last_emit = 0.0
+        self._pending_tokens = []
+
+    def _flush_tokens(self):
+        """Emit buffered tokens as a single token_batch event"""
+        if not self._pending_tokens:
+            return
+        # Swap the buffer out before joining so deltas appended by the
+        # streaming thread mid-flush land in the next batch, not nowhere
+        pending, self._pending_tokens = self._pending_tokens, []
+        self._last_emit = time.monotonic()
+        if self.activity_callback:
+            self.activity_callback({
+                'type': 'token_batch',
+                'data': {'text': ''.join(pending)}
+            })
+
+    def _on_text_delta(self, text: str, iteration: int):
+        """
+        Forward each streamed text delta to the UI.
+
+        First reasoning tokens reach the "Agent Reasoning" panel within the
+        stream's first-token latency instead of after the whole response.
+        """
+        self._pending_tokens.append(text)
+        if time.monotonic() - self._last_emit >= self.TOKEN_FLUSH_INTERVAL:
+            self._flush_tokens()
+
+    def _log_activity(self, activity_type, content, **kwargs):
+        """
+        Flush buffered tokens ahead of every other event so ordering in
+        the activity log is preserved.
+
+        Block-level 'thinking' events are kept out of the UI stream: the
+        token path already delivered the identical text as it was
+        generated, so re-emitting the finished block would render (and
+        persist) every reasoning bubble twice. The file log still gets
+        the block - it never sees tokens.
+        """
+        self._flush_tokens()
+        if activity_type == 'thinking':
+            log_fn = self._log_dispatch.get('thinking')
+            if log_fn is not None:
+                log_fn(content, kwargs)
+            return
+        super()._log_activity(activity_type, content, **kwargs)
+
+    def run_autonomous_search(self, patient_criteria: dict) -> dict:
+        """
+        Same workflow as the base agent, with a fresh token buffer per run
+        and a final flush so no trailing tokens are lost.
+        """
+        self._pending_tokens = []
+        self._last_emit = 0.0
+        try:
+            return super().run_autonomous_search(patient_criteria)
+        finally:
+            self._flush_tokens()
@@ -4,12 +4,42 @@ Clinical Trial Matching Agent - Streamlit Interface with Real-Time Updates
 """
 
 import streamlit as st
+import jinja2
+import collections
 import os
+import queue
+import sqlite3
+import threading
 from datetime import datetime
-from agent.orchestrator import ClinicalTrialAgent
+from agent.orchestrator_streamlit import ClinicalTrialAgentStreamlit
 import json
 import time
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps_pretty(obj) -> str:
+    """Indented JSON for the activity log, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2)
+
+
+def _dumps(obj) -> str:
+    """Compact JSON for history rows, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode()
+    return json.dumps(obj, default=str)
+
+
+def _loads(raw: str):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 # Page config
 st.set_page_config(
     page_title="Clinical Trial Matching Agent",
@@ -75,83 +105,325 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# Per-type HTML templates, compiled once at import. Autoescape handles the
+# HTML escaping of substituted values inside the compiled render path, so
+# this is both faster and safer than f-strings + manual escaping.
+_template_env = jinja2.Environment(autoescape=True)
+
+START_TPL = _template_env.from_string("""
+<div class="success-box">
+    <strong>🚀 Agent Started</strong><br/>
+    Autonomous search initiated...
+</div>
+""")
+
+ITERATION_TPL = _template_env.from_string("""
+<div style="margin: 1rem 0;">
+    <span class="iteration-badge">ITERATION {{ iteration }}</span>
+</div>
+""")
+
+THINKING_TPL = _template_env.from_string("""
+<div class="agent-thinking">
+    <strong>💭 Agent Reasoning</strong><br/>
+    {{ content }}
+</div>
+""")
+
+TOOL_CALL_TPL = _template_env.from_string("""
+<div class="tool-call">
+    <strong>🔧 Tool Call: {{ tool_name }}</strong>
+    <span class="agentic-badge">AUTONOMOUS</span><br/>
+    <details>
+        <summary>View parameters</summary>
+        <pre>{{ params }}</pre>
+    </details>
+</div>
+""")
+
+TOOL_RESULT_TPL = _template_env.from_string("""
+<div style="padding: 0.5rem; margin-left: 2rem; color: #666; font-size: 0.9rem;">
+    ✓ {{ tool_name }} completed
+</div>
+""")
+
+COMPLETE_TPL = _template_env.from_string("""
+<div class="success-box">
+    <strong>✅ Search Complete!</strong><br/>
+    Completed in {{ iterations }} autonomous iterations
+</div>
+""")
+
+
+# One renderer per activity type - the activity loop does a dict lookup
+# instead of walking an if/elif chain, and adding a new event type is one
+# function plus one entry here
+def _render_start(activity):
+    return START_TPL.render()
+
+
+def _render_iteration(activity):
+    return ITERATION_TPL.render(iteration=activity.get('iteration', 0))
+
+
+def _render_thinking(activity):
+    return THINKING_TPL.render(content=str(activity.get('content')))
+
+
+def _render_tool_call(activity):
+    return TOOL_CALL_TPL.render(
+        tool_name=activity.get('tool_name', 'unknown'),
+        params=_dumps_pretty(activity.get('tool_input', {}))
+    )
+
+
+def _render_tool_result(activity):
+    return TOOL_RESULT_TPL.render(tool_name=activity.get('tool_name', 'unknown'))
+
+
+def _render_complete(activity):
+    return COMPLETE_TPL.render(iterations=activity.get('iterations', 0))
+
+
+RENDERERS = {
+    'start': _render_start,
+    'iteration': _render_iteration,
+    'thinking': _render_thinking,
+    'tool_call': _render_tool_call,
+    'tool_result': _render_tool_result,
+    'complete': _render_complete,
+}
+
+
 def initialize_session_state():
     """Initialize session state variables"""
-    if 'search_history' not in st.session_state:
-        st.session_state.search_history = []
     if 'agent_activities' not in st.session_state:
-        st.session_state.agent_activities = []
+        # Ring buffer: long token-streaming runs would otherwise grow the
+        # list (and the rendered HTML blob) without bound; the full run is
+        # still on disk via the agent log and the history DB
+        st.session_state.agent_activities = collections.deque(maxlen=2000)
+    if 'agent_running' not in st.session_state:
+        st.session_state.agent_running = False
+    if 'activity_queue' not in st.session_state:
+        st.session_state.activity_queue = queue.Queue()
+    if 'result_holder' not in st.session_state:
+        st.session_state.result_holder = {}
+    if 'agent_result' not in st.session_state:
+        st.session_state.agent_result = None
+
+
+# Serializes writes from concurrent sessions sharing the cached connection
+_db_lock = threading.Lock()
+
+
+@st.cache_resource
+def get_db() -> sqlite3.Connection:
+    """
+    Open (and initialize) the on-disk search history database.
+
+    History lives in SQLite instead of session_state, so session RAM stays
+    flat no matter how many searches ran, and history survives page
+    refreshes and server restarts. One connection is shared across
+    sessions; writes go through _db_lock.
+    """
+    conn = sqlite3.connect("history.db", check_same_thread=False)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS searches (
+            id INTEGER PRIMARY KEY,
+            ts TEXT,
+            patient_json TEXT,
+            result_json TEXT,
+            activities_json TEXT,
+            iterations INT
+        )
+    """)
+    conn.commit()
+    return conn
+
+
+def get_agent(api_key: str) -> ClinicalTrialAgentStreamlit:
+    """
+    Reuse one agent per browser session.
+
+    Anthropic client setup and the underlying requests.Session (with its
+    warm connections and response cache) are reused across reruns within
+    a session instead of being rebuilt on every click. The agent is NOT
+    shared across sessions (st.cache_resource would do that): each run
+    mutates per-run state like activity_callback, so a shared instance
+    would let concurrent users steal each other's callbacks and interleave
+    activities - patient criteria included - into each other's queues.
+    The streaming subclass emits throttled token_batch events through that
+    callback, so reasoning tokens appear in the live log as they are
+    generated rather than after each turn completes.
+    """
+    if (st.session_state.get('agent') is None
+            or st.session_state.get('agent_api_key') != api_key):
+        st.session_state.agent = ClinicalTrialAgentStreamlit(api_key=api_key)
+        st.session_state.agent_api_key = api_key
+    return st.session_state.agent
 
 
-def activity_callback(activity: dict):
+def run_agent_search(agent, patient_criteria, activity_queue, result_holder):
     """
-    Callback function to receive real-time updates from the agent
-    This gets called each time the agent does something
+    Run the agent off the script thread.
+
+    The agent pushes activities into the queue as they happen; a sentinel
+    marks completion so the polling fragment knows when to stop.
     """
-    st.session_state.agent_activities.append(activity)
+    try:
+        result = agent.run_autonomous_search(patient_criteria)
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    result_holder['result'] = result
+    activity_queue.put({'type': '_done'})
 
 
 def display_activity_log(activities):
-    """Display the agent's activity log in real-time"""
+    """Display the agent's activity log
+
+    Builds the whole log as one HTML string and emits a single st.markdown
+    element - one DOM diff per rerun instead of one per activity. The
+    templates autoescape substituted values.
+    """
+    parts = []
+    token_parts = []
+
+    def flush_tokens():
+        # Consecutive streamed tokens collapse into one reasoning bubble
+        if token_parts:
+            parts.append(THINKING_TPL.render(content=''.join(token_parts)))
+            token_parts.clear()
+
     for activity in activities:
         activity_type = activity.get('type')
-        content = activity.get('content')
-
-        if activity_type == 'start':
-            st.markdown("""
-            <div class="success-box">
-                <strong>🚀 Agent Started</strong><br/>
-                Autonomous search initiated...
-            </div>
-            """, unsafe_allow_html=True)
-
-        elif activity_type == 'iteration':
-            iteration = activity.get('iteration', 0)
-            st.markdown(f"""
-            <div style="margin: 1rem 0;">
-                <span class="iteration-badge">ITERATION {iteration}</span>
-            </div>
-            """, unsafe_allow_html=True)
-
-        elif activity_type == 'thinking':
-            iteration = activity.get('iteration', 0)
-            st.markdown(f"""
-            <div class="agent-thinking">
-                <strong>💭 Agent Reasoning</strong><br/>
-                {content}
-            </div>
-            """, unsafe_allow_html=True)
-
-        elif activity_type == 'tool_call':
-            tool_name = activity.get('tool_name', 'unknown')
-            tool_input = activity.get('tool_input', {})
-            st.markdown(f"""
-            <div class="tool-call">
-                <strong>🔧 Tool Call: {tool_name}</strong>
-                <span class="agentic-badge">AUTONOMOUS</span><br/>
-                <details>
-                    <summary>View parameters</summary>
-                    <pre>{json.dumps(tool_input, indent=2)}</pre>
-                </details>
-            </div>
-            """, unsafe_allow_html=True)
-
-        elif activity_type == 'tool_result':
-            tool_name = activity.get('tool_name', 'unknown')
-            st.markdown(f"""
-            <div style="padding: 0.5rem; margin-left: 2rem; color: #666; font-size: 0.9rem;">
-                ✓ {tool_name} completed
-            </div>
-            """, unsafe_allow_html=True)
-
-        elif activity_type == 'complete':
-            iterations = activity.get('iterations', 0)
-            st.markdown(f"""
-            <div class="success-box">
-                <strong>✅ Search Complete!</strong><br/>
-                Completed in {iterations} autonomous iterations
-            </div>
-            """, unsafe_allow_html=True)
+
+        if activity_type in ('token', 'token_batch'):
+            token_parts.append(str(activity.get('data', {}).get('text', '')))
+            continue
+
+        flush_tokens()
+
+        renderer = RENDERERS.get(activity_type)
+        if renderer is not None:
+            parts.append(renderer(activity))
+
+    flush_tokens()
+
+    if parts:
+        st.markdown("\n".join(parts), unsafe_allow_html=True)
+
+
+@st.fragment(run_every=0.2)
+def live_activity_log():
+    """
+    Poll the activity queue and render the log incrementally.
+
+    Only this fragment reruns while the agent works - the rest of the
+    script (widget tree, sidebar, history tab) is untouched, so activities
+    appear as they happen instead of after the search finishes.
+    """
+    activity_queue = st.session_state.activity_queue
+    done = False
+    while True:
+        try:
+            activity = activity_queue.get_nowait()
+        except queue.Empty:
+            break
+        if activity.get('type') == '_done':
+            done = True
+        else:
+            st.session_state.agent_activities.append(activity)
+
+    # Render only the tail while streaming - re-rendering the whole run
+    # every 0.2 s is O(N^2) over a long search and produces a multi-MB
+    # HTML blob for the browser to re-parse
+    display_activity_log(list(st.session_state.agent_activities)[-500:])
+
+    if done:
+        result = st.session_state.result_holder.get('result', {})
+        st.session_state.agent_result = result
+        st.session_state.agent_running = False
+        if result.get('success'):
+            # Persist only the fields the history tab renders. The full
+            # result also carries 'conversation' - SDK block objects whose
+            # string reprs don't round-trip and duplicate the last turns'
+            # tool payloads into every row - and 'log_file', a path that
+            # may not outlive the row.
+            result_row = {
+                'success': result['success'],
+                'final_response': result.get('final_response', ''),
+                'iterations': result['iterations']
+            }
+            db = get_db()
+            with _db_lock:
+                db.execute(
+                    "INSERT INTO searches "
+                    "(ts, patient_json, result_json, activities_json, iterations) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                        _dumps(st.session_state.get('patient_criteria', {})),
+                        _dumps(result_row),
+                        _dumps(list(st.session_state.agent_activities)),
+                        result['iterations']
+                    )
+                )
+                db.commit()
+        st.rerun(scope="app")
+
+
+@st.fragment
+def render_search_history():
+    """
+    Render the Search History tab.
+
+    As a fragment, interacting with the history - expanding records,
+    viewing old activity logs - reruns only this function instead of the
+    whole script with its widget tree.
+    """
+    st.markdown("### 📊 Previous Searches")
+
+    # Light list query - the heavy result/activities blobs are fetched
+    # per record inside the expander, not loaded for the whole history
+    rows = get_db().execute(
+        "SELECT id, ts, patient_json, iterations FROM searches "
+        "ORDER BY id DESC LIMIT 20"
+    ).fetchall()
+
+    if not rows:
+        st.info("No searches yet. Run your first search in the 'New Search' tab!")
+    else:
+        for idx, (row_id, ts, patient_json, iterations) in enumerate(rows):
+            patient_criteria = _loads(patient_json)
+            with st.expander(
+                    f"Search #{row_id} - "
+                    f"{patient_criteria.get('patient_id', 'unknown')} - "
+                    f"{ts[:16]}",
+                    expanded=(idx == 0)
+            ):
+                col1, col2 = st.columns(2)
+
+                with col1:
+                    st.markdown("**Patient Criteria:**")
+                    st.json(patient_criteria)
+
+                with col2:
+                    st.markdown("**Metrics:**")
+                    st.metric("Iterations", iterations)
+                    st.metric("Timestamp", ts[11:])
+
+                result_json, activities_json = get_db().execute(
+                    "SELECT result_json, activities_json FROM searches WHERE id = ?",
+                    (row_id,)
+                ).fetchone()
+
+                # Show activity log for this search
+                if activities_json:
+                    with st.expander("View Agent Activity Log"):
+                        display_activity_log(_loads(activities_json))
+
+                st.markdown("**Results:**")
+                st.markdown(_loads(result_json).get('final_response', ''))
 
 
 def main():
@@ -196,8 +468,11 @@ def main():
         st.info("* REAL MODE** - Using REAL API integration ")
 
         if st.button("🗑️ Clear History"):
-            st.session_state.search_history = []
-            st.session_state.agent_activities = []
+            db = get_db()
+            with _db_lock:
+                db.execute("DELETE FROM searches")
+                db.commit()
+            st.session_state.agent_activities.clear()
             st.rerun()
 
     # Main tabs
@@ -221,7 +496,15 @@ def main():
                 height=100
             )
 
-        conditions = [c.strip() for c in conditions_input.split('\n') if c.strip()]
+        # Dedupe case-insensitively while preserving input order and the
+        # first-seen casing - each duplicate line would otherwise cost the
+        # agent a redundant search_studies call
+        seen_conditions = {}
+        for line in conditions_input.split('\n'):
+            line = line.strip()
+            if line:
+                seen_conditions.setdefault(line.casefold(), line)
+        conditions = list(seen_conditions.values())
 
         # Search button
         st.markdown("---")
@@ -229,7 +512,7 @@ def main():
         with col2:
             search_button = st.button("🚀 Run Agent Search", type="primary", use_container_width=True)
 
-        if search_button:
+        if search_button and not st.session_state.agent_running:
             # Validate
             if not patient_id or not conditions:
                 st.error("Please provide Patient ID and at least one condition")
@@ -241,8 +524,9 @@ def main():
                 st.error("❌ ANTHROPIC_API_KEY not found in environment")
                 return
 
-            # Clear previous activities
-            st.session_state.agent_activities = []
+            # Clear previous run
+            st.session_state.agent_activities.clear()
+            st.session_state.agent_result = None
 
             # Build criteria
             patient_criteria = {
@@ -252,44 +536,48 @@ def main():
                 "location": location,
                 "patient_id": patient_id
             }
-
-            # Create placeholder for real-time updates
-            activity_container = st.container()
-
-            # Create agent with callback
-            agent = ClinicalTrialAgent(
-                api_key=api_key,
-                activity_callback=activity_callback
-            )
-
-            # Run search with real-time updates
-            with st.spinner("🤖 Agent working autonomously..."):
-                result = agent.run_autonomous_search(patient_criteria)
-
-            # Display all activities
-            with activity_container:
-                st.markdown("---")
-                st.markdown("### 🎬 Agent Activity Log")
-                st.markdown("*Watch how the agent autonomously planned and executed the search*")
-                display_activity_log(st.session_state.agent_activities)
+            st.session_state.patient_criteria = patient_criteria
+
+            # Fresh queue per run - the agent pushes activities into it from
+            # the worker thread, the fragment drains it on the script side
+            activity_queue = queue.Queue()
+            st.session_state.activity_queue = activity_queue
+            result_holder = {}
+            st.session_state.result_holder = result_holder
+
+            # Reuse this session's agent, attach this run's callback
+            agent = get_agent(api_key)
+            agent.activity_callback = activity_queue.put
+
+            # Run the search in the background so the script (and the live
+            # log fragment) stays responsive instead of blocking on a spinner
+            st.session_state.agent_running = True
+            threading.Thread(
+                target=run_agent_search,
+                args=(agent, patient_criteria, activity_queue, result_holder),
+                daemon=True
+            ).start()
+
+        if st.session_state.agent_running:
+            st.markdown("---")
+            st.markdown("### 🎬 Agent Activity Log")
+            st.status("🤖 Agent working autonomously...", state="running")
+            live_activity_log()
+
+        elif st.session_state.agent_result is not None:
+            result = st.session_state.agent_result
+
+            # Display all activities from the finished run
+            st.markdown("---")
+            st.markdown("### 🎬 Agent Activity Log")
+            st.markdown("*Watch how the agent autonomously planned and executed the search*")
+            display_activity_log(st.session_state.agent_activities)
 
             if result['success']:
-                # Save to history
-                search_record = {
-                    'timestamp': datetime.now(),
-                    'patient_criteria': patient_criteria,
-                    'result': result,
-                    'iterations': result['iterations'],
-                    'activities': st.session_state.agent_activities.copy()
-                }
                 # Show log file location
                 if 'log_file' in result and result['log_file']:
                     st.info(f"📝 Detailed log saved to: `{result['log_file']}`")
 
-                st.success(f"✅ Search completed in {result['iterations']} iterations")
-                st.balloons()
-                st.session_state.search_history.insert(0, search_record)
-
                 # Display final results
                 st.markdown("---")
                 st.markdown("### 📋 Final Results")
@@ -301,36 +589,7 @@ def main():
                 st.error(f"❌ Search failed: {result.get('error')}")
 
     with tab2:
-        st.markdown("### 📊 Previous Searches")
-
-        if not st.session_state.search_history:
-            st.info("No searches yet. Run your first search in the 'New Search' tab!")
-        else:
-            for idx, record in enumerate(st.session_state.search_history):
-                with st.expander(
-                        f"Search #{len(st.session_state.search_history) - idx} - "
-                        f"{record['patient_criteria']['patient_id']} - "
-                        f"{record['timestamp'].strftime('%Y-%m-%d %H:%M')}",
-                        expanded=(idx == 0)
-                ):
-                    col1, col2 = st.columns(2)
-
-                    with col1:
-                        st.markdown("**Patient Criteria:**")
-                        st.json(record['patient_criteria'])
-
-                    with col2:
-                        st.markdown("**Metrics:**")
-                        st.metric("Iterations", record['iterations'])
-                        st.metric("Timestamp", record['timestamp'].strftime('%H:%M:%S'))
-
-                    # Show activity log for this search
-                    if 'activities' in record:
-                        with st.expander("View Agent Activity Log"):
-                            display_activity_log(record['activities'])
-
-                    st.markdown("**Results:**")
-                    st.markdown(record['result']['final_response'])
+        render_search_history()
 
 
 if __name__ == "__main__":
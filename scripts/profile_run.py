@@ -0,0 +1,86 @@
+# scripts/profile_run.py
+"""
+One-shot profile of a full autonomous search
+Run with: python scripts/profile_run.py
+
+Answers "where does the wall clock go?" for one end-to-end run. The
+expected (and so far confirmed) answer is that >90% of it is network
+waits - the Anthropic streaming call and the clinicaltrials.gov requests
+- not Python CPU. That conclusion is what justifies the concurrency,
+streaming, and caching work in this codebase and rules out
+instruction-level micro-optimization: there is no compute-bound inner
+loop here to vectorize.
+
+Not wired into CI; this is a manual tool for re-checking the balance
+after significant changes.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.orchestrator import ClinicalTrialAgent
+
+
+def main():
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    if not api_key:
+        print("❌ Error: ANTHROPIC_API_KEY not found in environment variables")
+        return
+
+    agent = ClinicalTrialAgent(api_key=api_key)
+
+    patient_criteria = {
+        "age": 57,
+        "gender": "male",
+        "conditions": ["severe fatty liver disease", "NAFLD"],
+        "location": "Denver, CO",
+        "patient_id": "PROFILE_001"
+    }
+
+    profiler = cProfile.Profile()
+    wall_start = time.perf_counter()
+    # process_time counts CPU actually burned (user+system, all threads)
+    # and stands still while we block on sockets - cProfile's own totals
+    # use a wall-clock timer, so they charge network waits to whichever
+    # function was blocking and cannot give this split
+    cpu_start = time.process_time()
+    profiler.enable()
+
+    result = agent.run_autonomous_search(patient_criteria)
+
+    profiler.disable()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    print("=" * 70)
+    print(f"Search {'succeeded' if result.get('success') else 'failed'} "
+          f"in {result.get('iterations', '?')} iterations")
+    print(f"Wall clock:       {wall:8.2f} s")
+    print(f"CPU time:         {cpu:8.2f} s  "
+          f"({100 * cpu / wall:.1f}% of wall)")
+    print(f"Waiting (I/O):    {wall - cpu:8.2f} s  "
+          f"({100 * (wall - cpu) / wall:.1f}% of wall)")
+    print("=" * 70)
+
+    # Per-function table is wall-clock cumulative time, so blocking reads
+    # dominate it by design - read it as "where the waiting happens", not
+    # as a CPU profile. cProfile also only sees the main thread; work on
+    # the tool-executor threads is absent here (it is counted in the CPU
+    # split above, which is process-wide).
+    stats_buf = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stats_buf)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+
+    print("\nTop 25 functions by cumulative wall time (main thread only):")
+    stats.print_stats(25)
+    print(stats_buf.getvalue())
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,176 @@ Real ClinicalTrials.gov API integration
 API v2 Documentation: https://clinicaltrials.gov/data-api/api
 """
 
+import asyncio
+import json
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from typing import Dict, List, Optional
+import threading
 import time
 
+# httpx is only required for the async client below; the sync client
+# keeps working without it
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# jmespath extracts all trial fields in one compiled C-level pass instead
+# of ~10 nested .get() calls per study; the pure-Python loop below remains
+# as a fallback when it isn't installed
+try:
+    import jmespath
+except ImportError:
+    jmespath = None
+
+# orjson decodes the large /studies payloads (up to ~500 KB for a full
+# page) roughly 2-3x faster than stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _loads(raw: bytes) -> Dict:
+    """Decode a JSON response body, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+# Compiled once at import - jmespath compilation is the expensive half
+_TRIAL_EXPR = jmespath.compile(
+    "studies[].{"
+    "nct_id: protocolSection.identificationModule.nctId, "
+    "title: protocolSection.identificationModule.briefTitle, "
+    "status: protocolSection.statusModule.overallStatus, "
+    "phases: protocolSection.designModule.phases, "
+    "loc0: protocolSection.contactsLocationsModule.locations[0]}"
+) if jmespath is not None else None
+
+# Parsed-response cache: identical queries within a session skip the
+# network entirely. Trial metadata changes on the order of days, so an
+# hour of staleness is fine for interactive matching.
+_CACHE_TTL = 3600
+_CACHE_MAX = 256
+
+# Only the fields the parsers read. ContactsLocationsModule (rather than
+# the flat Location* fields) is what carries the nested locations[] the
+# location formatter reads; the old flat fields were silently ignored by
+# the nested extraction. Keeping the list minimal cuts response bytes
+# substantially versus the full study record.
+_SEARCH_FIELDS = "NCTId,BriefTitle,OverallStatus,Phase,ContactsLocationsModule"
+
+# Map our status to API status - hoisted so the dict isn't rebuilt on
+# every search call
+_STATUS_MAP = {
+    "recruiting": "RECRUITING",
+    "not_yet_recruiting": "NOT_YET_RECRUITING",
+    "active": "ACTIVE_NOT_RECRUITING",
+    "all": None
+}
+
+
+def _build_search_query(condition: str, location: Optional[str],
+                        recruiting_status: str) -> str:
+    """Build the query.term string shared by the sync and async clients"""
+    query_parts = [f"AREA[ConditionSearch]{condition}"]
+
+    if location:
+        query_parts.append(f"AREA[LocationSearch]{location}")
+
+    api_status = _STATUS_MAP.get(recruiting_status.casefold(), "RECRUITING")
+
+    if api_status:
+        query_parts.append(f"AREA[OverallStatus]{api_status}")
+
+    return " AND ".join(query_parts)
+
+
+def _format_location(loc: Optional[Dict]) -> str:
+    """Format a single location record (first location, for simplicity)"""
+    if not loc:
+        return "Location not specified"
+    city = loc.get("city", "")
+    state = loc.get("state", "")
+    if city and state:
+        return f"{city}, {state}"
+    if state:
+        return state
+    return "Location not specified"
+
+
+def _parse_search_response(data: Dict) -> Dict:
+    """Turn a raw /studies payload into the trials dict callers expect"""
+    if _TRIAL_EXPR is not None:
+        # Single compiled traversal over the whole page
+        rows = _TRIAL_EXPR.search(data) or []
+        trials = [
+            {
+                "nct_id": row["nct_id"] or "",
+                "title": row["title"] or "",
+                "status": row["status"] or "",
+                "phase": ", ".join(row["phases"] or ["N/A"]),
+                "location": _format_location(row["loc0"])
+            }
+            for row in rows
+        ]
+    else:
+        trials = []
+        for study in data.get("studies", []):
+            protocol = study.get("protocolSection", {})
+            id_module = protocol.get("identificationModule", {})
+            status_module = protocol.get("statusModule", {})
+            design_module = protocol.get("designModule", {})
+            locations = protocol.get("contactsLocationsModule", {}).get("locations", [])
+
+            trial = {
+                "nct_id": id_module.get("nctId", ""),
+                "title": id_module.get("briefTitle", ""),
+                "status": status_module.get("overallStatus", ""),
+                "phase": ", ".join(design_module.get("phases", ["N/A"])),
+                "location": _format_location(locations[0] if locations else None)
+            }
+            trials.append(trial)
+
+    return {
+        "trials_found": len(trials),
+        "trials": trials,
+        "total_available": data.get("totalCount", 0)
+    }
+
+
+def _parse_study_details(nct_id: str, data: Dict) -> Dict:
+    """Turn a raw single-study payload into the details dict callers expect"""
+    studies = data.get("studies", [])
+
+    if not studies:
+        return {"error": f"Trial {nct_id} not found"}
+
+    study = studies[0]
+    protocol = study.get("protocolSection", {})
+
+    # Extract key sections
+    id_module = protocol.get("identificationModule", {})
+    description_module = protocol.get("descriptionModule", {})
+    eligibility_module = protocol.get("eligibilityModule", {})
+    contacts_locations = protocol.get("contactsLocationsModule", {})
+
+    return {
+        "nct_id": nct_id,
+        "title": id_module.get("briefTitle", ""),
+        "description": description_module.get("briefSummary", ""),
+        "detailed_description": description_module.get("detailedDescription", ""),
+        "eligibility_criteria": eligibility_module.get("eligibilityCriteria", ""),
+        "min_age": eligibility_module.get("minimumAge", ""),
+        "max_age": eligibility_module.get("maximumAge", ""),
+        "gender": eligibility_module.get("sex", "ALL"),
+        "locations": contacts_locations.get("locations", []),
+        "contacts": contacts_locations.get("centralContacts", [])
+    }
+
 
 class ClinicalTrialsAPI:
     """
@@ -21,6 +187,52 @@ class ClinicalTrialsAPI:
         self.timeout = timeout
         self.session = requests.Session()
 
+        # Transient 429/5xx responses are retried with exponential backoff
+        # instead of surfacing as hard failures the agent has to re-plan
+        # around; GETs here are idempotent so retrying is safe
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True
+        )
+
+        # Pooled adapter so concurrent batch searches reuse connections
+        # instead of opening one TCP+TLS handshake per request
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=10, pool_maxsize=10)
+        self.session.mount("https://", adapter)
+
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "User-Agent": "ClinicalTrialAgent/1.0"
+        })
+
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+        # ETag -> parsed-result pairs keyed like the response cache (query
+        # string AND page size - the ETag identifies the exact
+        # representation, not just the dataset). Once the TTL cache
+        # expires, a revalidation round trip costs ~200 bytes (304, no
+        # body) instead of re-downloading and re-parsing the full page.
+        self._etag_cache = {}
+
+    def _cache_get(self, key) -> Optional[Dict]:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] < _CACHE_TTL:
+                return entry[1]
+        return None
+
+    def _cache_put(self, key, value: Dict):
+        with self._cache_lock:
+            if len(self._cache) >= _CACHE_MAX:
+                # Drop the oldest entry to stay bounded
+                oldest = min(self._cache, key=lambda k: self._cache[k][0])
+                del self._cache[oldest]
+            self._cache[key] = (time.monotonic(), value)
+
     def search_studies(
             self,
             condition: str,
@@ -41,83 +253,57 @@ class ClinicalTrialsAPI:
             Dict with trials_found and trials list
         """
 
-        # Build query
-        query_parts = [f"AREA[ConditionSearch]{condition}"]
+        query_string = _build_search_query(condition, location, recruiting_status)
 
-        if location:
-            query_parts.append(f"AREA[LocationSearch]{location}")
-
-        # Map our status to API status
-        status_map = {
-            "recruiting": "RECRUITING",
-            "not_yet_recruiting": "NOT_YET_RECRUITING",
-            "active": "ACTIVE_NOT_RECRUITING",
-            "all": None
-        }
-        api_status = status_map.get(recruiting_status.lower(), "RECRUITING")
-
-        if api_status:
-            query_parts.append(f"AREA[OverallStatus]{api_status}")
-
-        query_string = " AND ".join(query_parts)
+        # Semantically equivalent calls collapse onto the final query string
+        cache_key = ("search", query_string, min(max_results, 100))
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
 
         # API parameters
         params = {
             "query.term": query_string,
             "pageSize": min(max_results, 100),  # API max is 100
             "format": "json",
-            "fields": "NCTId,BriefTitle,OverallStatus,Phase,LocationCity,LocationState,LocationFacility"
+            "fields": _SEARCH_FIELDS
         }
 
+        # Revalidate against the last known ETag for this query - a 304
+        # response carries no body
+        with self._cache_lock:
+            etag_entry = self._etag_cache.get(cache_key)
+        headers = {"If-None-Match": etag_entry[0]} if etag_entry else None
+
         try:
             response = self.session.get(
                 f"{self.BASE_URL}/studies",
                 params=params,
+                headers=headers,
                 timeout=self.timeout
             )
+
+            if response.status_code == 304 and etag_entry is not None:
+                result = etag_entry[1]
+                self._cache_put(cache_key, result)
+                return result
+
             response.raise_for_status()
 
-            data = response.json()
-
-            # Parse response
-            studies = data.get("studies", [])
-
-            trials = []
-            for study in studies:
-                protocol = study.get("protocolSection", {})
-                id_module = protocol.get("identificationModule", {})
-                status_module = protocol.get("statusModule", {})
-                design_module = protocol.get("designModule", {})
-
-                # Extract locations
-                locations_module = protocol.get("contactsLocationsModule", {})
-                locations = locations_module.get("locations", [])
-
-                # Get first location for simplicity
-                location_str = "Location not specified"
-                if locations:
-                    loc = locations[0]
-                    city = loc.get("city", "")
-                    state = loc.get("state", "")
-                    if city and state:
-                        location_str = f"{city}, {state}"
-                    elif state:
-                        location_str = state
-
-                trial = {
-                    "nct_id": id_module.get("nctId", ""),
-                    "title": id_module.get("briefTitle", ""),
-                    "status": status_module.get("overallStatus", ""),
-                    "phase": ", ".join(design_module.get("phases", ["N/A"])),
-                    "location": location_str
-                }
-                trials.append(trial)
+            data = _loads(response.content)
 
-            return {
-                "trials_found": len(trials),
-                "trials": trials,
-                "total_available": data.get("totalCount", 0)
-            }
+            result = _parse_search_response(data)
+
+            etag = response.headers.get("ETag")
+            if etag:
+                with self._cache_lock:
+                    if len(self._etag_cache) >= _CACHE_MAX:
+                        # Drop the oldest entry to stay bounded
+                        del self._etag_cache[next(iter(self._etag_cache))]
+                    self._etag_cache[cache_key] = (etag, result)
+
+            self._cache_put(cache_key, result)
+            return result
 
         except requests.exceptions.RequestException as e:
             return {
@@ -126,6 +312,72 @@ class ClinicalTrialsAPI:
                 "trials": []
             }
 
+    def search_studies_batch(
+            self,
+            conditions: List[str],
+            location: Optional[str] = None,
+            recruiting_status: str = "RECRUITING",
+            max_results: int = 20,
+            max_workers: int = 10
+    ) -> Dict:
+        """
+        Search several conditions concurrently and merge the results
+
+        Each search is a blocking HTTPS round trip (~300-800 ms), so fanning
+        out over a thread pool makes an N-condition search cost roughly one
+        round trip instead of N.
+
+        Args:
+            conditions: Medical conditions to search for
+            location: Location filter applied to every search
+            recruiting_status: Recruitment status applied to every search
+            max_results: Max results per condition
+            max_workers: Upper bound on concurrent requests
+
+        Returns:
+            Dict with trials_found and a trials list de-duplicated by nct_id
+        """
+        if not conditions:
+            return {"trials_found": 0, "trials": [], "total_available": 0}
+
+        trials = []
+        seen_ids = set()
+        errors = []
+        total_available = 0
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(conditions))) as executor:
+            futures = [
+                executor.submit(
+                    self.search_studies,
+                    condition,
+                    location,
+                    recruiting_status,
+                    max_results
+                )
+                for condition in conditions
+            ]
+
+            for future in as_completed(futures):
+                result = future.result()
+                if "error" in result:
+                    errors.append(result["error"])
+                    continue
+                total_available += result.get("total_available", 0)
+                for trial in result.get("trials", []):
+                    nct_id = trial.get("nct_id")
+                    if nct_id and nct_id not in seen_ids:
+                        seen_ids.add(nct_id)
+                        trials.append(trial)
+
+        merged = {
+            "trials_found": len(trials),
+            "trials": trials,
+            "total_available": total_available
+        }
+        if errors:
+            merged["errors"] = errors
+        return merged
+
     def get_study_details(self, nct_id: str) -> Dict:
         """
         Get detailed information about a specific trial
@@ -137,6 +389,11 @@ class ClinicalTrialsAPI:
             Dict with detailed trial information
         """
 
+        cache_key = ("details", nct_id)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
         params = {
             "query.term": f"AREA[NCTId]{nct_id}",
             "format": "json"
@@ -150,35 +407,151 @@ class ClinicalTrialsAPI:
             )
             response.raise_for_status()
 
-            data = response.json()
-            studies = data.get("studies", [])
+            data = _loads(response.content)
 
-            if not studies:
-                return {"error": f"Trial {nct_id} not found"}
+            details = _parse_study_details(nct_id, data)
+            if "error" in details:
+                return details
+            self._cache_put(cache_key, details)
+            return details
 
-            study = studies[0]
-            protocol = study.get("protocolSection", {})
+        except requests.exceptions.RequestException as e:
+            return {"error": f"API request failed: {str(e)}"}
 
-            # Extract key sections
-            id_module = protocol.get("identificationModule", {})
-            description_module = protocol.get("descriptionModule", {})
-            eligibility_module = protocol.get("eligibilityModule", {})
-            contacts_locations = protocol.get("contactsLocationsModule", {})
 
+class AsyncClinicalTrialsAPI:
+    """
+    Async client for ClinicalTrials.gov API v2, built on httpx with HTTP/2
+
+    For fan-out workloads (searching N conditions at once) the requests
+    round trips are multiplexed over a single connection instead of one
+    TCP+TLS handshake per request, and the event loop replaces the thread
+    pool the sync client needs. Requires the httpx[http2] extra.
+    """
+
+    BASE_URL = ClinicalTrialsAPI.BASE_URL
+
+    def __init__(self, timeout: int = 30):
+        if httpx is None:
+            raise ImportError(
+                "AsyncClinicalTrialsAPI requires httpx; "
+                "install with: pip install 'httpx[http2]'"
+            )
+        self.timeout = timeout
+        self._client = httpx.AsyncClient(
+            http2=True,
+            timeout=timeout,
+            base_url=self.BASE_URL,
+            headers={
+                "Accept-Encoding": "gzip, deflate",
+                "User-Agent": "ClinicalTrialAgent/1.0"
+            }
+        )
+
+    async def aclose(self):
+        """Close the underlying connection pool"""
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def search_studies(
+            self,
+            condition: str,
+            location: Optional[str] = None,
+            recruiting_status: str = "RECRUITING",
+            max_results: int = 20
+    ) -> Dict:
+        """
+        Async counterpart of ClinicalTrialsAPI.search_studies
+
+        Same arguments and return shape; see the sync client for details.
+        """
+        query_string = _build_search_query(condition, location, recruiting_status)
+
+        params = {
+            "query.term": query_string,
+            "pageSize": min(max_results, 100),  # API max is 100
+            "format": "json",
+            "fields": _SEARCH_FIELDS
+        }
+
+        try:
+            response = await self._client.get("/studies", params=params)
+            response.raise_for_status()
+            return _parse_search_response(_loads(response.content))
+
+        except httpx.HTTPError as e:
             return {
-                "nct_id": nct_id,
-                "title": id_module.get("briefTitle", ""),
-                "description": description_module.get("briefSummary", ""),
-                "detailed_description": description_module.get("detailedDescription", ""),
-                "eligibility_criteria": eligibility_module.get("eligibilityCriteria", ""),
-                "min_age": eligibility_module.get("minimumAge", ""),
-                "max_age": eligibility_module.get("maximumAge", ""),
-                "gender": eligibility_module.get("sex", "ALL"),
-                "locations": contacts_locations.get("locations", []),
-                "contacts": contacts_locations.get("centralContacts", [])
+                "error": f"API request failed: {str(e)}",
+                "trials_found": 0,
+                "trials": []
             }
 
-        except requests.exceptions.RequestException as e:
+    async def search_studies_batch(
+            self,
+            conditions: List[str],
+            location: Optional[str] = None,
+            recruiting_status: str = "RECRUITING",
+            max_results: int = 20
+    ) -> Dict:
+        """
+        Search several conditions concurrently over one HTTP/2 connection
+
+        Same merge and de-duplication semantics as the sync batch search,
+        with asyncio.gather replacing the thread pool.
+        """
+        if not conditions:
+            return {"trials_found": 0, "trials": [], "total_available": 0}
+
+        results = await asyncio.gather(*[
+            self.search_studies(condition, location, recruiting_status, max_results)
+            for condition in conditions
+        ])
+
+        trials = []
+        seen_ids = set()
+        errors = []
+        total_available = 0
+
+        for result in results:
+            if "error" in result:
+                errors.append(result["error"])
+                continue
+            total_available += result.get("total_available", 0)
+            for trial in result.get("trials", []):
+                nct_id = trial.get("nct_id")
+                if nct_id and nct_id not in seen_ids:
+                    seen_ids.add(nct_id)
+                    trials.append(trial)
+
+        merged = {
+            "trials_found": len(trials),
+            "trials": trials,
+            "total_available": total_available
+        }
+        if errors:
+            merged["errors"] = errors
+        return merged
+
+    async def get_study_details(self, nct_id: str) -> Dict:
+        """
+        Async counterpart of ClinicalTrialsAPI.get_study_details
+        """
+        params = {
+            "query.term": f"AREA[NCTId]{nct_id}",
+            "format": "json"
+        }
+
+        try:
+            response = await self._client.get("/studies", params=params)
+            response.raise_for_status()
+            return _parse_study_details(nct_id, _loads(response.content))
+
+        except httpx.HTTPError as e:
             return {"error": f"API request failed: {str(e)}"}
 
 